@@ -1,14 +1,27 @@
 import os
-import json
-import traceback
+import re
+import asyncio
+import logging
+import mimetypes
+import stat
+from hashlib import sha256
+from dataclasses import dataclass
+from typing import Dict, Any, Set
+import anyio
+import httpx
+import orjson
 from dotenv import load_dotenv
-from groq import Groq
+from groq import AsyncGroq
+from cachetools import LRUCache, TTLCache
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, conint, conlist, constr
 
 # ---------------------------
 # Load environment variables
@@ -16,13 +29,62 @@ from pydantic import BaseModel
 load_dotenv()
 api_key = os.getenv("GROQ_API_KEY")
 
+# uvicorn only configures its own loggers, so the app's logger gets its own
+# handler (same layout as uvicorn's lines) instead of relying on the root logger
+log = logging.getLogger("scheduler")
+log.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+if not log.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter("%(levelname)s:     %(name)s - %(message)s"))
+    log.addHandler(_log_handler)
+    log.propagate = False
+
 if not api_key:
-    print("⚠️ Warning: GROQ_API_KEY not set. Schedule generation will fail.")
+    log.warning("GROQ_API_KEY not set: tasks not matched by keyword patterns or the cache will be scheduled as Unknown")
+
+# ---------------------------
+# Groq client (one keep-alive connection pool shared by all requests)
+# ---------------------------
+# Short connect/pool timeouts so a stuck connection or exhausted pool fails fast
+# instead of holding a request; read covers the slowest completions we expect
+GROQ_TIMEOUT = httpx.Timeout(connect=2.0, read=20.0, write=5.0, pool=2.0)
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    timeout=GROQ_TIMEOUT,
+)
+aclient = (
+    AsyncGroq(api_key=api_key, http_client=http_client, timeout=GROQ_TIMEOUT, max_retries=2)
+    if api_key else None
+)
+
+# Cap in-flight Groq calls to stay under the provider's rate limit; the SDK
+# already retries 429s with exponential backoff
+_GROQ_SEM = asyncio.Semaphore(int(os.getenv("GROQ_MAX_CONCURRENCY", "16")))
+
+# ---------------------------
+# Redis (optional): shares sessions and classifications across workers
+# ---------------------------
+redis_url = os.getenv("REDIS_URL", "").strip()
+redis_client = None
+if redis_url:
+    import redis.asyncio as aioredis
+    from redis.exceptions import WatchError
+    redis_client = aioredis.from_url(redis_url)
 
 # ---------------------------
 # FastAPI app
 # ---------------------------
-app = FastAPI(title="AI Conscious Scheduler")
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (faster than the stdlib encoder)."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+app = FastAPI(title="AI Conscious Scheduler", default_response_class=ORJSONResponse)
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
 
 # ---------------------------
 # CORS setup
@@ -38,109 +100,230 @@ origins = [
 if frontend_url:
     origins.append(frontend_url)
 
+class WildcardCORSMiddleware:
+    """
+    CORS for ALLOW_ALL_ORIGINS: every origin, method and header is allowed
+    without credentials, so the response headers are fixed and there's no
+    per-request origin matching to do.
+    """
+
+    ALLOW_ORIGIN = (b"access-control-allow-origin", b"*")
+    # lets browser clients read /schedule's ETag to send back as If-None-Match
+    EXPOSE_HEADERS = (b"access-control-expose-headers", b"ETag")
+    PREFLIGHT_HEADERS = [
+        ALLOW_ORIGIN,
+        (b"access-control-allow-methods", b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"),
+        (b"access-control-max-age", b"600"),
+        (b"content-type", b"text/plain; charset=utf-8"),
+        (b"content-length", b"2"),
+    ]
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS":
+            headers = dict(scope["headers"])
+            if b"origin" in headers and b"access-control-request-method" in headers:
+                # answer the preflight here; allowed headers echo what was asked for
+                requested = headers.get(b"access-control-request-headers", b"*")
+                await send({
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": self.PREFLIGHT_HEADERS + [(b"access-control-allow-headers", requested)],
+                })
+                await send({"type": "http.response.body", "body": b"OK"})
+                return
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), self.ALLOW_ORIGIN, self.EXPOSE_HEADERS]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
 allow_all = os.getenv("ALLOW_ALL_ORIGINS", "true").lower() in ("1", "true", "yes")
 if allow_all:
-    origins = ["*"]
-    allow_credentials_flag = False
+    app.add_middleware(WildcardCORSMiddleware)
 else:
-    allow_credentials_flag = True
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=allow_credentials_flag,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag"],
+    )
+
+# ---------------------------
+# Response compression (added last, so it wraps everything above)
+# ---------------------------
+class StreamAwareGZipMiddleware:
+    """
+    GZipMiddleware, except for streaming endpoints: older Starlette releases
+    buffer a gzipped streaming body until it ends, which would hold back every
+    NDJSON line until the last one.
+    """
+
+    UNCOMPRESSED_PATHS = frozenset({"/schedule/stream"})
+
+    def __init__(self, app, minimum_size: int = 500):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.UNCOMPRESSED_PATHS:
+            await self.app(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
+
+app.add_middleware(StreamAwareGZipMiddleware, minimum_size=500)
 
 # ---------------------------
 # Request and Response Models
 # ---------------------------
+# Bounded so one request can't blow up the prompt or the scheduler
 class TaskInput(BaseModel):
-    tasks: list[str]
-    energy: int
-    mood: str
+    tasks: conlist(constr(strip_whitespace=True, max_length=200), max_length=50)
+    energy: conint(ge=0, le=10)
+    mood: constr(max_length=32)
 
+# Response models only describe the /schedule payload in OpenAPI; they are
+# never mutated, and unknown fields would be a bug in our own output
 class ScheduleItem(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     time: str
     task: str
     type: str
     reason: str
 
 class ScheduleResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     schedule: list[ScheduleItem]
 
+# ---------------------------
+# Classified task (internal; converted to dicts only in schedule output)
+# ---------------------------
+@dataclass(slots=True)
+class Classified:
+    task: str
+    type: str
+    reason: str = ""
+
 # ---------------------------
 # Energy + mood aware scheduling with breaks
 # ---------------------------
-def assign_slots_with_breaks(tasks, energy, mood):
-    # Base slots per energy zone
-    energy_slots = {
-        "high": ["9 AM", "10 AM", "11 AM", "12 PM"],
-        "medium": ["1 PM", "2 PM", "3 PM", "4 PM"],
-        "low": ["5 PM", "6 PM", "7 PM", "8 PM"]
-    }
+# Base slots per energy zone
+ENERGY_SLOTS = {
+    "high": ("9 AM", "10 AM", "11 AM", "12 PM"),
+    "medium": ("1 PM", "2 PM", "3 PM", "4 PM"),
+    "low": ("5 PM", "6 PM", "7 PM", "8 PM")
+}
+ALL_SLOTS = ENERGY_SLOTS["high"] + ENERGY_SLOTS["medium"] + ENERGY_SLOTS["low"]
+TYPE_PRIORITY = {"Deep Work": 1, "Creative": 2, "Shallow": 3}
+DEFAULT_PRIORITY = 3
+LOW_MOODS = frozenset({"tired", "low"})
+HAPPY_MOODS = frozenset({"happy", "excited", "inspired"})
+
+def _energy_bucket(energy):
+    # the zone rules only compare energy against 4, 5 and 7
+    return 3 if energy >= 7 else 2 if energy >= 5 else 1 if energy >= 4 else 0
+
+def _mood_bucket(mood_lower):
+    return "low" if mood_lower in LOW_MOODS else "happy" if mood_lower in HAPPY_MOODS else "neutral"
 
-    mood_lower = mood.lower()
-    type_priority = {"Deep Work": 1, "Creative": 2, "Shallow": 3}
-    tasks_sorted = sorted(tasks, key=lambda t: type_priority.get(t.get('type', ''), 3))
+def _zone_rule(t_type, energy, mood_bucket):
+    """Energy zone for a task type, given energy and mood."""
+    if t_type == "Deep Work":
+        if energy >= 7 and mood_bucket != "low":
+            return "high"
+        return "medium" if energy >= 4 else "low"
+    if t_type == "Creative":
+        if mood_bucket == "happy":
+            return "high" if energy >= 5 else "medium"
+        return "medium" if energy >= 5 else "low"
+    # Shallow (and anything unrecognized)
+    return "medium" if energy >= 5 else "low"
+
+# (energy bucket, mood bucket) -> {task type -> zone}, built once from _zone_rule
+# using one representative energy per bucket
+ZONE_TABLE = {
+    (e_bucket, m_bucket): {t: _zone_rule(t, energy, m_bucket) for t in ("Deep Work", "Creative", "Shallow")}
+    for e_bucket, energy in enumerate((0, 4, 5, 7))
+    for m_bucket in ("low", "happy", "neutral")
+}
+
+def _priority(c):
+    return TYPE_PRIORITY.get(c.type, DEFAULT_PRIORITY)
+
+def _sort_tasks(tasks):
+    """Order tasks by type priority (Deep Work, Creative, then everything else)."""
+    return sorted(tasks, key=_priority)
+
+def _new_slot_state():
+    # Slots are always taken in order within a zone, so a counter per zone
+    # tracks what's used; overflow slots share one counter to stay unique
+    return {"high": 0, "medium": 0, "low": 0, "overflow": 0, "deep_work": 0}
+
+def _assign_sorted(tasks_sorted, energy, mood, state, start_index=0):
+    """
+    Assign slots to already-sorted tasks, advancing `state` in place.
+    Returns (schedule, states, offsets): states[i] is a copy of the slot state
+    before task i and offsets[i] its position in the schedule (counted from
+    `start_index`), so a later update can resume from any task. Both carry
+    one trailing entry for the end of the schedule, to resume after the last task.
+    """
+    zone_of = ZONE_TABLE[_energy_bucket(energy), _mood_bucket(mood.lower())]
+    default_zone = zone_of["Shallow"]
 
     schedule = []
-    used_slots = set()
-    deep_work_count = 0
-    slot_extension_counter = 0
+    states = []
+    offsets = []
 
     for task in tasks_sorted:
-        t_type = task.get("type", "")
+        t_type = task.type
+        states.append(dict(state))
+        offsets.append(start_index + len(schedule))
 
         # Determine zone based on energy and mood
-        if t_type == "Deep Work":
-            if energy >= 7 and mood_lower not in ["tired", "low"]:
-                zone = "high"
-            elif energy >= 4:
-                zone = "medium"
-            else:
-                zone = "low"
-        elif t_type == "Creative":
-            if mood_lower in ["happy", "excited", "inspired"]:
-                zone = "high" if energy >= 5 else "medium"
-            else:
-                zone = "medium" if energy >= 5 else "low"
-        else:  # Shallow
-            zone = "medium" if energy >= 5 else "low"
-
-        # Find first available slot in zone
-        slot = next((s for s in energy_slots[zone] if s not in used_slots), None)
-
-        # If all slots in the zone are used, extend dynamically
-        if not slot:
-            all_slots_flat = sum(energy_slots.values(), [])
-            while True:
-                base_slot = all_slots_flat[slot_extension_counter % len(all_slots_flat)]
-                new_slot = f"{base_slot} (+{slot_extension_counter // len(all_slots_flat) + 1})"
-                slot_extension_counter += 1
-                if new_slot not in used_slots:
-                    slot = new_slot
-                    break
+        zone = zone_of.get(t_type, default_zone)
 
-        used_slots.add(slot)
+        # Take the next slot in zone, extending dynamically once it's full
+        zone_slots = ENERGY_SLOTS[zone]
+        i = state[zone]
+        if i < len(zone_slots):
+            slot = zone_slots[i]
+            state[zone] = i + 1
+        else:
+            overflow = state["overflow"]
+            slot = f"{ALL_SLOTS[overflow % len(ALL_SLOTS)]} (+{overflow // len(ALL_SLOTS) + 1})"
+            state["overflow"] = overflow + 1
 
         schedule.append({
             "time": slot,
-            "task": task.get("task", ""),
+            "task": task.task,
             "type": t_type,
-            "reason": task.get("reason", "")
+            "reason": task.reason
         })
 
         # Insert a break after every 2 Deep Work sessions
         if t_type == "Deep Work":
-            deep_work_count += 1
-            if deep_work_count % 2 == 0:
-                break_slot = next((s for s in sum(energy_slots.values(), []) if s not in used_slots), None)
-                if not break_slot:
-                    break_slot = f"Break (+{slot_extension_counter})"
-                    slot_extension_counter += 1
-                used_slots.add(break_slot)
+            state["deep_work"] += 1
+            if state["deep_work"] % 2 == 0:
+                # earliest free slot across all zones
+                break_zone = next((z for z in ENERGY_SLOTS if state[z] < len(ENERGY_SLOTS[z])), None)
+                if break_zone:
+                    break_slot = ENERGY_SLOTS[break_zone][state[break_zone]]
+                    state[break_zone] += 1
+                else:
+                    break_slot = f"Break (+{state['overflow']})"
+                    state["overflow"] += 1
                 schedule.append({
                     "time": break_slot,
                     "task": "Take a short break",
@@ -148,163 +331,668 @@ def assign_slots_with_breaks(tasks, energy, mood):
                     "reason": "Recharge before next deep work session"
                 })
 
+    states.append(dict(state))
+    offsets.append(start_index + len(schedule))
+    return schedule, states, offsets
+
+def assign_slots_with_breaks(tasks, energy, mood):
+    schedule, _, _ = _assign_sorted(_sort_tasks(tasks), energy, mood, _new_slot_state())
     return schedule
 
 # ---------------------------
 # Health check endpoint
 # ---------------------------
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok"}
 
 # ---------------------------
-# Schedule generation endpoint (Batch Classification)
+# Keyword fast-path (skips the LLM for obvious tasks)
+# ---------------------------
+PATTERNS = [
+    (re.compile(r"\b(report|analysis|code|debug)\b", re.I), "Deep Work", "Keyword match: focused work"),
+    (re.compile(r"\b(design|draft|brainstorm|sketch)\b", re.I), "Creative", "Keyword match: creative work"),
+    (re.compile(r"\b(email|reply|slack|meeting)\b", re.I), "Shallow", "Keyword match: routine communication"),
+]
+
+def _match_pattern(task: str):
+    for pattern, t_type, reason in PATTERNS:
+        if pattern.search(task):
+            return Classified(task, t_type, reason)
+    return None
+
+# ---------------------------
+# Classification cache (keyed by normalized task text)
+# ---------------------------
+# temperature=0 makes classifications deterministic, so a task seen before
+# doesn't need another Groq round-trip. The in-process TTLCache is checked
+# first; with REDIS_URL set, Redis backs it so all workers share one cache.
+_CLS_TTL = 86_400  # seconds
+_cls_cache = TTLCache(maxsize=10_000, ttl=_CLS_TTL)
+_cls_cache_stats = {"hits": 0, "misses": 0}
+
+def _cache_key(task: str) -> str:
+    return task.strip().lower()
+
+def _redis_cls_key(key: str) -> str:
+    return "cls:" + sha256(key.encode()).hexdigest()
+
+# ---------------------------
+# Groq batch classification
 # ---------------------------
-@app.post("/schedule", response_model=ScheduleResponse)
-def generate_schedule(input: TaskInput):
-    # Build one prompt for all tasks
-    prompt = f"""
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+
+# Everything in the prompt except the task list is fixed, so it's encoded once
+PROMPT_PREFIX_BYTES = b"""
 Classify the following tasks strictly as one of [Deep Work, Creative, Shallow].
 For each task, also provide a one-line reason.
 
 Respond ONLY with a JSON array in this format:
 [
-  {{"task": "Finish report", "type": "Deep Work", "reason": "Requires focus"}},
-  {{"task": "Design logo", "type": "Creative", "reason": "Needs creativity"}}
+  {"task": "Finish report", "type": "Deep Work", "reason": "Requires focus"},
+  {"task": "Design logo", "type": "Creative", "reason": "Needs creativity"}
 ]
 
-Tasks: {json.dumps(input.tasks)}
-"""
+Tasks: """
+PROMPT_SUFFIX_BYTES = b"\n"
+_SYSTEM_MESSAGE = {"role": "system", "content": "You are a helpful assistant."}
 
-    schedule = []
+# Each answer object repeats its task, so budget ~1 token per 3 characters of
+# task text plus room for the type, a one-line reason and the JSON around them.
+# The ceiling is the model's output limit; TaskInput's bounds stay well under it.
+_TOKENS_PER_OBJECT = 64
+_MAX_OUTPUT_TOKENS = 8192
+
+def _max_output_tokens(tasks) -> int:
+    needed = sum(len(t) // 3 + _TOKENS_PER_OBJECT for t in tasks) + 32
+    return min(_MAX_OUTPUT_TOKENS, needed)
 
+def _groq_request(tasks):
+    """Chat completion arguments for classifying `tasks` in one call."""
+    prompt = b"".join([PROMPT_PREFIX_BYTES, orjson.dumps(tasks), PROMPT_SUFFIX_BYTES]).decode()
+    return {
+        "model": "llama-3.1-8b-instant",
+        "messages": [
+            _SYSTEM_MESSAGE,
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0,
+        "max_tokens": _max_output_tokens(tasks),
+    }
+
+async def _classify_with_groq(tasks):
+    """Classify `tasks` in one Groq call. Returns one Classified per task, in order."""
+    if aclient is None:
+        return [Classified(t, "Unknown") for t in tasks]
     try:
-        client = Groq(api_key=api_key)
-
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
-        )
+        async with _GROQ_SEM:
+            response = await aclient.chat.completions.create(**_groq_request(tasks))
 
-        # Extract model response
+        # Extract model response, dropping ```json code fences if present
+        choice = response.choices[0]
         raw_content = (
-            getattr(response.choices[0].message, "content", None)
-            or response.choices[0].message.get("content", "")
-        ).strip()
-
-        # Clean JSON if wrapped in code fences
-        if raw_content.startswith("```"):
-            raw_content = raw_content.strip("` \n")
-            if raw_content.startswith("json"):
-                raw_content = raw_content[len("json"):].strip()
+            getattr(choice.message, "content", None)
+            or choice.message.get("content", "")
+        )
+        raw_content = _FENCE_RE.sub("", raw_content.strip())
 
-        print("\n==== RAW RESPONSE ====")
-        print(raw_content)
-        print("====================\n")
+        log.debug("raw groq response: %s", raw_content)
 
-        parsed = json.loads(raw_content)
+        if getattr(choice, "finish_reason", None) == "length":
+            # cut off at max_tokens: keep every object that did complete
+            log.warning("groq reply truncated, keeping complete objects")
+            parsed = _complete_objects(raw_content)
+        else:
+            parsed = orjson.loads(raw_content)
         if isinstance(parsed, list):
-            schedule = parsed
+            # Index by normalized task text so results follow input order even
+            # if the model re-cases or re-spaces a task, and tasks it dropped
+            # still get a fallback entry
+            by_key = {}
+            for p in parsed:
+                if isinstance(p, dict) and isinstance(p.get("task"), str):
+                    by_key.setdefault(_cache_key(p["task"]), p)
+            matched = [by_key.get(_cache_key(t)) for t in tasks]
+            # Only trust position when no task matched by text: once some do, the
+            # model may have reordered its answers, and a wrong pairing would be
+            # cached while an Unknown is not
+            if not any(matched) and len(parsed) == len(tasks):
+                matched = [p if isinstance(p, dict) else None for p in parsed]
+            return [
+                Classified(t, (p or {}).get("type") or "Unknown", (p or {}).get("reason") or "")
+                for t, p in zip(tasks, matched)
+            ]
+        log.warning("unexpected groq response format, falling back")
+
+    except Exception:
+        log.exception("groq call failed")
+
+    return [Classified(t, "Unknown") for t in tasks]
+
+class _ObjectScanner:
+    """Pulls complete top-level {...} objects out of JSON text that arrives in chunks."""
+
+    def __init__(self):
+        self._buf = []
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+
+    def feed(self, text: str) -> list:
+        done = []
+        for ch in text:
+            if self._depth == 0:
+                # outside an object: skip array brackets, commas, code fences
+                if ch == "{":
+                    self._depth = 1
+                    self._buf = [ch]
+                continue
+            self._buf.append(ch)
+            if self._in_str:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    done.append("".join(self._buf))
+        return done
+
+def _complete_objects(text: str) -> list:
+    """Every complete, parseable top-level object in (possibly truncated) JSON text."""
+    objects = []
+    for raw in _ObjectScanner().feed(text):
+        try:
+            objects.append(orjson.loads(raw))
+        except orjson.JSONDecodeError:
+            continue
+    return objects
+
+async def _stream_classify_with_groq(tasks):
+    """
+    Like _classify_with_groq, but streams the completion and yields each
+    Classified as soon as its JSON object is complete. Yields exactly one
+    result per distinct task; any the model skips come last as Unknown.
+    """
+    if aclient is None:
+        for t in dict.fromkeys(tasks):
+            yield Classified(t, "Unknown")
+        return
+
+    # normalized key -> the distinct task texts still waiting on it
+    remaining: Dict[str, list] = {}
+    for t in dict.fromkeys(tasks):
+        remaining.setdefault(_cache_key(t), []).append(t)
+    try:
+        scanner = _ObjectScanner()
+        async with _GROQ_SEM:
+            stream = await aclient.chat.completions.create(**_groq_request(tasks), stream=True)
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                for raw in scanner.feed(delta):
+                    try:
+                        p = orjson.loads(raw)
+                    except orjson.JSONDecodeError:
+                        continue
+                    t = p.get("task") if isinstance(p, dict) else None
+                    if isinstance(t, str) and _cache_key(t) in remaining:
+                        for task in remaining.pop(_cache_key(t)):
+                            yield Classified(task, p.get("type") or "Unknown", p.get("reason") or "")
+
+    except Exception:
+        log.exception("groq stream failed")
+
+    for texts in remaining.values():
+        for t in texts:
+            yield Classified(t, "Unknown")
+
+async def _classify_local(tasks):
+    """
+    Classify what keyword patterns and the caches can answer without Groq.
+    Returns (results, miss_idx); results[i] is None for every index in miss_idx.
+    Without a Groq client every remaining task comes back as Unknown instead.
+    """
+    results = [None] * len(tasks)
+    miss_idx = []
+    lookups = 0
+    for i, t in enumerate(tasks):
+        matched = _match_pattern(t)
+        if matched is not None:
+            results[i] = matched
+            continue
+        lookups += 1
+        cached = _cls_cache.get(_cache_key(t))
+        if cached is not None:
+            results[i] = Classified(t, *cached)
         else:
-            print("❌ Unexpected format, falling back.")
-            schedule = [{"task": t, "type": "Unknown", "reason": ""} for t in input.tasks]
+            miss_idx.append(i)
+
+    if redis_client is not None and miss_idx:
+        try:
+            raw = await redis_client.mget([_redis_cls_key(_cache_key(tasks[i])) for i in miss_idx])
+        except Exception:
+            log.exception("redis classification lookup failed")
+            raw = [None] * len(miss_idx)
+        still_missing = []
+        for i, value in zip(miss_idx, raw):
+            if value is None:
+                still_missing.append(i)
+                continue
+            cached = tuple(orjson.loads(value))
+            _cls_cache[_cache_key(tasks[i])] = cached
+            results[i] = Classified(tasks[i], *cached)
+        miss_idx = still_missing
 
-    except Exception as e:
-        print("\n" + "="*50)
-        print("Groq error caught!")
-        print(e)
-        traceback.print_exc()
-        print("="*50 + "\n")
-        schedule = [{"task": t, "type": "Unknown", "reason": ""} for t in input.tasks]
+    _cls_cache_stats["hits"] += lookups - len(miss_idx)
+    _cls_cache_stats["misses"] += len(miss_idx)
 
-    final_schedule = assign_slots_with_breaks(schedule, input.energy, input.mood)
-    return {"schedule": final_schedule}
+    if aclient is None and miss_idx:
+        # no API key: nothing left to ask, so the rest fall back right away
+        for i in miss_idx:
+            results[i] = Classified(tasks[i], "Unknown")
+        miss_idx = []
+    return results, miss_idx
+
+async def _remember(items):
+    """Cache fresh classifications locally and, in one pipelined round-trip, in Redis."""
+    # never cache fallbacks, so a Groq outage doesn't stick
+    entries = {_cache_key(c.task): (c.type, c.reason) for c in items if c.type != "Unknown"}
+    if not entries:
+        return
+    _cls_cache.update(entries)
+    if redis_client is not None:
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key, cached in entries.items():
+                    pipe.set(_redis_cls_key(key), orjson.dumps(cached), ex=_CLS_TTL)
+                await pipe.execute()
+        except Exception:
+            log.exception("redis classification store failed")
+
+# Groq calls in progress, by cache key; concurrent requests for the same task
+# wait on the first one instead of classifying it again
+_inflight: Dict[str, asyncio.Future] = {}
+
+async def _classify_single_flight(tasks):
+    """
+    Classify `tasks` with Groq, sending each distinct task at most once and
+    joining calls already in flight for it. Returns one Classified per task, in order.
+    """
+    positions: Dict[str, list] = {}
+    for i, t in enumerate(tasks):
+        positions.setdefault(_cache_key(t), []).append(i)
+
+    owned = [k for k in positions if k not in _inflight]
+    futures = {k: _inflight[k] for k in positions if k in _inflight}
+    if owned:
+        loop = asyncio.get_running_loop()
+        for k in owned:
+            futures[k] = _inflight[k] = loop.create_future()
+        try:
+            fresh = await _classify_with_groq([tasks[positions[k][0]] for k in owned])
+            for k, item in zip(owned, fresh):
+                futures[k].set_result(item)
+            # waiters resume first; cache writes don't hold them up
+            await _remember(fresh)
+        finally:
+            for k in owned:
+                del _inflight[k]
+                if not futures[k].done():
+                    # cancelled mid-call; let waiters fall back rather than fail
+                    futures[k].set_result(Classified(tasks[positions[k][0]], "Unknown"))
+
+    results = [None] * len(tasks)
+    for k, idx in positions.items():
+        # shielded so a cancelled waiter doesn't cancel the shared future
+        item = await asyncio.shield(futures[k])
+        for i in idx:
+            results[i] = item if item.task == tasks[i] else Classified(tasks[i], item.type, item.reason)
+    return results
+
+async def classify_tasks(tasks):
+    """Classify tasks via keyword patterns, then the cache, sending only the rest to Groq."""
+    results, miss_idx = await _classify_local(tasks)
+    if miss_idx:
+        fresh = await _classify_single_flight([tasks[i] for i in miss_idx])
+        for i, item in zip(miss_idx, fresh):
+            results[i] = item
+    return results
+
+# ---------------------------
+# Schedule generation endpoint (Batch Classification)
+# ---------------------------
+# Identical (tasks, energy, mood) requests get an identical schedule, so the
+# encoded response body is kept and repeats are answered without touching Groq
+_req_cache = TTLCache(maxsize=2000, ttl=3600)
+request_cache_enabled = os.getenv("SCHEDULE_CACHE", "true").lower() in ("1", "true", "yes")
+
+def _request_key(input: TaskInput) -> str:
+    # task order is kept: it decides slot order between tasks of the same type
+    return sha256(orjson.dumps({"t": input.tasks, "e": input.energy, "m": input.mood.lower()})).hexdigest()
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # only an exact tag: on a POST, "*" means "fail if anything exists", not "send a 304"
+    return any(t.strip().removeprefix("W/") == etag for t in header.split(","))
+
+# The schedule is built by our own code, so it's serialized straight to JSON;
+# ScheduleResponse only documents the shape in OpenAPI.
+@app.post("/schedule", responses={200: {"model": ScheduleResponse}, 304: {"description": "Schedule unchanged"}})
+async def generate_schedule(input: TaskInput, request: Request) -> Response:
+    key = _request_key(input)
+    # the ETag names the request, so a client retrying one it already has a
+    # schedule for gets a 304 without any classification work
+    etag = f'"{key}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"etag": etag})
+
+    if request_cache_enabled and key in _req_cache:
+        return Response(_req_cache[key], media_type="application/json", headers={"etag": etag})
+
+    classified = await classify_tasks(input.tasks)
+    final_schedule = assign_slots_with_breaks(classified, input.energy, input.mood)
+    body = orjson.dumps({"schedule": final_schedule})
+
+    # don't pin fallback classifications from a failed Groq call, in either
+    # cache; the client should retry those for real
+    if any(c.type == "Unknown" for c in classified):
+        return Response(body, media_type="application/json")
+    if request_cache_enabled:
+        _req_cache[key] = body
+    return Response(body, media_type="application/json", headers={"etag": etag})
+
+# ---------------------------
+# Streaming schedule endpoint (NDJSON)
+# ---------------------------
+def _ndjson(obj) -> bytes:
+    return orjson.dumps(obj) + b"\n"
+
+async def _stream_schedule(input: TaskInput):
+    results, miss_idx = await _classify_local(input.tasks)
+    for c in results:
+        if c is not None:
+            yield _ndjson(c)
+
+    if miss_idx:
+        # a task listed twice fills every position it appears at
+        positions = {}
+        for i in miss_idx:
+            positions.setdefault(input.tasks[i], []).append(i)
+        fresh = []
+        async for item in _stream_classify_with_groq(list(positions)):
+            fresh.append(item)
+            for i in positions[item.task]:
+                results[i] = item
+            yield _ndjson(item)
+        await _remember(fresh)
+
+    yield _ndjson({"schedule": assign_slots_with_breaks(results, input.energy, input.mood)})
+
+@app.post("/schedule/stream")
+async def generate_schedule_stream(input: TaskInput):
+    """
+    Same schedule as /schedule, streamed as newline-delimited JSON: one
+    {"task", "type", "reason"} line per task as soon as it is classified
+    (Groq output is parsed while it streams), then a final {"schedule": [...]} line.
+    """
+    return StreamingResponse(_stream_schedule(input), media_type="application/x-ndjson")
+
+# ---------------------------
+# Classification cache stats (debug)
+# ---------------------------
+@app.get("/cache/stats")
+async def cache_stats():
+    return {**_cls_cache_stats, "size": len(_cls_cache)}
 
 # ---------------------------
 # Real-time session layer (append this block BEFORE the "Serve React build" section)
 # ---------------------------
 import uuid
-import asyncio
+from bisect import bisect_left, bisect_right
 from fastapi import WebSocket, WebSocketDisconnect, Body
-from typing import Dict, Any, List
 
-# Simple in-memory session store
+# Session store: in-memory by default, or Redis when REDIS_URL is set so
+# several workers can share sessions. Either way, entries expire a day after
+# their last update so long-running deploys don't accumulate abandoned sessions.
 # session_id -> {
 #   "input": TaskInput dict,
 #   "energy": int,
 #   "mood": str,
-#   "classified_tasks": [{ "task": str, "type": str, "reason": str }, ...],
+#   "classified_tasks": [Classified, ...],  # priority order, no breaks
 #   "current_schedule": [ { "time":..., "task":..., "type":..., "reason":... }, ... ],
-#   "skipped": [ ... ]
+#   "skipped": [ ... ],
+#   "_slot_states": [ slot state before classified_tasks[i], ..., end state ],
+#   "_offsets": [ index of classified_tasks[i] in current_schedule, ..., len(current_schedule) ]
+#   "_order": [ index in input.tasks of classified_tasks[i], ... ]
+#   "version": int,  # bumped on every change; patches carry the version they produce
 # }
-_realtime_sessions: Dict[str, Dict[str, Any]] = {}
+_SESSION_TTL = 86_400  # seconds
+_realtime_sessions: TTLCache = TTLCache(maxsize=10_000, ttl=_SESSION_TTL)
 
-# websockets per session for broadcasting updates
-_ws_connections: Dict[str, List[WebSocket]] = {}
+# websockets per session for broadcasting updates (always local to this worker)
+_ws_connections: Dict[str, Set[WebSocket]] = {}
+# session version each socket has been sent up to; a patch at or below it is
+# already part of what the client has
+_ws_versions: Dict[WebSocket, int] = {}
+# (version, data) held for sockets still waiting on their initial message
+_ws_buffers: Dict[WebSocket, list] = {}
 
 # helper: create session id
 def _make_session_id() -> str:
     return uuid.uuid4().hex
 
-async def _broadcast_to_session(session_id: str):
-    """Send the session's current_schedule to all open websockets for this session."""
-    conns = _ws_connections.get(session_id, [])
-    payload = {"type": "schedule_update", "schedule": _realtime_sessions.get(session_id, {}).get("current_schedule", [])}
-    dead = []
+def _session_key(session_id: str) -> str:
+    return f"sess:{session_id}"
+
+def _updates_channel(session_id: str) -> str:
+    return f"sess:{session_id}:updates"
+
+def _decode_session(raw: bytes) -> Dict[str, Any]:
+    # orjson writes Classified as plain objects; rebuild them on the way back
+    sess = orjson.loads(raw)
+    sess["classified_tasks"] = [Classified(**c) for c in sess["classified_tasks"]]
+    sess["skipped"] = [Classified(**c) for c in sess["skipped"]]
+    return sess
+
+async def _load_session(session_id: str):
+    if redis_client is None:
+        return _realtime_sessions.get(session_id)
+    raw = await redis_client.get(_session_key(session_id))
+    if raw is None:
+        return None
+    return _decode_session(raw)
+
+async def _store_session(session_id: str, sess: Dict[str, Any]):
+    """Save a session, refreshing its TTL."""
+    if redis_client is None:
+        _realtime_sessions[session_id] = sess
+    else:
+        await redis_client.set(_session_key(session_id), orjson.dumps(sess), ex=_SESSION_TTL)
+
+async def _session_exists(session_id: str) -> bool:
+    if redis_client is None:
+        return session_id in _realtime_sessions
+    return bool(await redis_client.exists(_session_key(session_id)))
+
+async def _broadcast_to_session(session_id: str, payload: Dict[str, Any]):
+    """
+    Send `payload` to this worker's websockets for the session. Only used
+    without Redis; with Redis, _update_session publishes and every worker's
+    relay delivers.
+    """
+    # encode once for all subscribers
+    await _send_to_local_sockets(session_id, orjson.dumps(payload).decode(), payload["version"])
+
+async def _send_to_local_sockets(session_id: str, data: str, version: int):
+    """Send already-encoded `data`, the patch producing session `version`, to this worker's websockets."""
+    conns = _ws_connections.get(session_id)
+    if not conns:
+        return
+    targets = []
     for ws in conns:
-        try:
-            await ws.send_json(payload)
-        except Exception:
-            dead.append(ws)
+        buffer = _ws_buffers.get(ws)
+        if buffer is not None:
+            buffer.append((version, data))
+        elif version > _ws_versions.get(ws, -1):
+            _ws_versions[ws] = version
+            targets.append(ws)
+    # send in parallel so one slow client doesn't hold up the rest
+    results = await asyncio.gather(*(ws.send_text(data) for ws in targets), return_exceptions=True)
     # cleanup dead connections
-    for d in dead:
-        try:
-            conns.remove(d)
-        except ValueError:
-            pass
-    if conns:
-        _ws_connections[session_id] = conns
+    for ws, result in zip(targets, results):
+        if isinstance(result, Exception):
+            conns.discard(ws)
+
+async def _update_session(session_id: str, mutate):
+    """
+    Apply `mutate(sess) -> (result, message)` to a session. When `message` isn't
+    None the session is stored and `message` broadcast to its websockets.
+    Returns `result`, or None if the session doesn't exist.
+    With Redis, load, store and publish form one WATCH/MULTI transaction that
+    reruns `mutate` on a fresh copy if anything else wrote the session in
+    between, so concurrent updates from other tasks or workers aren't lost.
+    """
+    if redis_client is None:
+        # no await between load and store, so nothing can interleave
+        sess = _realtime_sessions.get(session_id)
+        if sess is None:
+            return None
+        result, message = mutate(sess)
+        if message is not None:
+            sess["version"] = message["version"] = sess["version"] + 1
+            await _store_session(session_id, sess)
+            _spawn(_broadcast_to_session(session_id, message))
+        return result
+
+    key = _session_key(session_id)
+    async with redis_client.pipeline() as pipe:
+        while True:
+            try:
+                await pipe.watch(key)
+                raw = await pipe.get(key)
+                if raw is None:
+                    return None
+                sess = _decode_session(raw)
+                result, message = mutate(sess)
+                if message is None:
+                    return result
+                sess["version"] = message["version"] = sess["version"] + 1
+                pipe.multi()
+                pipe.set(key, orjson.dumps(sess), ex=_SESSION_TTL)
+                # published in the same transaction, so patches go out in commit order
+                pipe.publish(_updates_channel(session_id), orjson.dumps(message))
+                await pipe.execute()
+                return result
+            except WatchError:
+                continue
+
+def _reschedule_tail(sess: Dict[str, Any], pos: int):
+    """
+    Reassign slots for classified_tasks[pos:], resuming from the slot state saved
+    at `pos`; earlier tasks keep their slots. Returns (from_index, items) for a
+    schedule_patch message.
+    """
+    start = sess["_offsets"][pos]
+    state = dict(sess["_slot_states"][pos])
+    suffix, states, offsets = _assign_sorted(
+        sess["classified_tasks"][pos:], sess["energy"], sess["mood"], state, start_index=start
+    )
+    del sess["current_schedule"][start:]
+    sess["current_schedule"].extend(suffix)
+    del sess["_slot_states"][pos:]
+    sess["_slot_states"].extend(states)
+    del sess["_offsets"][pos:]
+    sess["_offsets"].extend(offsets)
+    return start, suffix
+
+# keep references so pending background tasks aren't garbage collected
+_background_tasks: Set[asyncio.Task] = set()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def _insert_position(sess: Dict[str, Any], item: Classified, input_index: int) -> int:
+    """Where a full sort of the input would put `item`: by type priority, then input order."""
+    tasks, order = sess["classified_tasks"], sess["_order"]
+    return bisect_right(
+        range(len(tasks)), (_priority(item), input_index), key=lambda j: (_priority(tasks[j]), order[j])
+    )
+
+async def _progressive_build(session_id: str, tasks: list, input_indexes: list):
+    """
+    Classify `tasks` (input.tasks[input_indexes[i]] == tasks[i]) in one streamed
+    Groq call and splice each result into the schedule as it arrives.
+    """
+    positions: Dict[str, list] = {}
+    for t, i in zip(tasks, input_indexes):
+        positions.setdefault(t, []).append(i)
+
+    def insert(item: Classified):
+        def mutate(sess):
+            # a task listed twice goes in once per listing
+            from_pos = None
+            for input_index in positions[item.task]:
+                pos = _insert_position(sess, item, input_index)
+                sess["classified_tasks"].insert(pos, item)
+                sess["_order"].insert(pos, input_index)
+                from_pos = pos if from_pos is None else min(from_pos, pos)
+            from_index, items = _reschedule_tail(sess, from_pos)
+            return None, {"type": "schedule_patch", "from_index": from_index, "items": items}
+        return mutate
+
+    fresh = []
+    async for item in _stream_classify_with_groq(list(positions)):
+        fresh.append(item)
+        await _update_session(session_id, insert(item))
+    await _remember(fresh)
 
 # ---------------------------
-# Start a realtime session (calls your existing generate_schedule to build the initial schedule)
+# Start a realtime session (same classification + scheduling as /schedule)
 # ---------------------------
 @app.post("/realtime/start")
-def realtime_start(input: TaskInput):
+async def realtime_start(input: TaskInput):
     """
-    Start a realtime session. This calls your existing generate_schedule(input)
-    internally (so no change to your logic) and caches the schedule for updates.
-    Returns: { "session_id": str, "schedule": [...] }
+    Start a realtime session. Tasks answered by keyword patterns or the cache are
+    scheduled right away; the rest are classified in the background and streamed
+    to the session's websockets as schedule_patch messages as each one returns.
+    The session keeps the sorted tasks plus per-task slot state so updates only
+    reschedule what comes after the changed task.
+    Returns: { "session_id": str, "schedule": [...], "pending": int }
     """
     sid = _make_session_id()
-    # call existing function to get a schedule dict {"schedule": [...]} (keeps your logic intact)
-    result = generate_schedule(input)  # <- calling your route function directly
-    schedule_list = result.get("schedule", [])
-
-    # reconstruct classified tasks from the assigned schedule (task,type,reason exist there)
-    classified = []
-    for item in schedule_list:
-        # ensure keys exist (your assign_slots_with_breaks uses these keys)
-        classified.append({
-            "task": item.get("task", ""),
-            "type": item.get("type", ""),
-            "reason": item.get("reason", "")
-        })
+    results, miss_idx = await _classify_local(input.tasks)
+    order = sorted((i for i, c in enumerate(results) if c is not None), key=lambda i: _priority(results[i]))
+    classified = [results[i] for i in order]
+    schedule_list, states, offsets = _assign_sorted(classified, input.energy, input.mood, _new_slot_state())
 
-    _realtime_sessions[sid] = {
+    await _store_session(sid, {
         "input": {"tasks": input.tasks},
         "energy": input.energy,
         "mood": input.mood,
         "classified_tasks": classified,
         "current_schedule": schedule_list,
-        "skipped": []
-    }
-    # initialize empty ws list
-    _ws_connections[sid] = []
-    return {"session_id": sid, "schedule": schedule_list}
+        "skipped": [],
+        "_slot_states": states,
+        "_offsets": offsets,
+        "_order": order,
+        "version": 0,
+    })
+    if miss_idx:
+        _spawn(_progressive_build(sid, [input.tasks[i] for i in miss_idx], miss_idx))
+    return {"session_id": sid, "schedule": schedule_list, "pending": len(miss_idx)}
 
 # ---------------------------
 # Update a task in a realtime session
@@ -320,50 +1008,49 @@ async def realtime_update(payload: RealtimeUpdatePayload = Body(...)):
     Update a session task. `task_index` points to the index in the current schedule.
     - completed: remove from today's task list
     - skipped: remove from today's list and add to the session's skipped list (will be part of "tomorrow")
-    After change, recompute schedule using your assign_slots_with_breaks(...) and broadcast via websocket.
+    Only tasks after the removed one can move, so scheduling resumes from the
+    removed task's saved slot state and just that suffix is broadcast.
     """
-    sid = payload.session_id
-    if sid not in _realtime_sessions:
-        return {"error": "session_not_found"}
-
-    sess = _realtime_sessions[sid]
     idx = payload.task_index
 
-    if idx < 0 or idx >= len(sess["classified_tasks"]):
-        return {"error": "invalid_task_index"}
+    def mutate(sess):
+        # map the schedule index back to its task (break entries aren't tasks)
+        offsets = sess["_offsets"]
+        pos = bisect_left(offsets, idx)
+        if idx < 0 or pos >= len(sess["classified_tasks"]) or offsets[pos] != idx:
+            return {"error": "invalid_task_index"}, None
 
-    # remove the task from classified_tasks
-    task_obj = sess["classified_tasks"].pop(idx)
+        if payload.action not in ("completed", "skipped"):
+            return {"error": "invalid_action"}, None
 
-    if payload.action == "completed":
-        # completed -> we just drop it from today's tasks
-        pass
-    elif payload.action == "skipped":
-        # naive policy: add to skipped list for next-day handling
-        sess["skipped"].append(task_obj)
-    else:
-        return {"error": "invalid_action"}
+        # remove the task from classified_tasks
+        task_obj = sess["classified_tasks"].pop(pos)
+        del sess["_order"][pos]
 
-    # recompute today's schedule from remaining classified tasks
-    new_schedule = assign_slots_with_breaks(sess["classified_tasks"], sess["energy"], sess["mood"])
-    sess["current_schedule"] = new_schedule
+        if payload.action == "skipped":
+            # naive policy: add to skipped list for next-day handling
+            sess["skipped"].append(task_obj)
+        # completed -> we just drop it from today's tasks
 
-    # broadcast update (fire-and-forget)
-    try:
-        asyncio.create_task(_broadcast_to_session(sid))
-    except Exception:
-        pass
+        # reschedule only the tasks after the removed one and broadcast that tail
+        from_index, items = _reschedule_tail(sess, pos)
+        result = {"schedule": sess["current_schedule"], "skipped_count": len(sess["skipped"])}
+        return result, {"type": "schedule_patch", "from_index": from_index, "items": items}
 
-    return {"schedule": new_schedule, "skipped_count": len(sess["skipped"])}
+    result = await _update_session(payload.session_id, mutate)
+    if result is None:
+        return {"error": "session_not_found"}
+    return result
 
 # ---------------------------
 # Get the current schedule for a session
 # ---------------------------
 @app.get("/realtime/{session_id}/schedule")
-def realtime_get_schedule(session_id: str):
-    if session_id not in _realtime_sessions:
+async def realtime_get_schedule(session_id: str):
+    sess = await _load_session(session_id)
+    if sess is None:
         return {"error": "session_not_found"}
-    return {"schedule": _realtime_sessions[session_id]["current_schedule"], "skipped_count": len(_realtime_sessions[session_id]["skipped"])}
+    return {"schedule": sess["current_schedule"], "skipped_count": len(sess["skipped"])}
 
 # ---------------------------
 # WebSocket endpoint for real-time updates
@@ -373,22 +1060,33 @@ async def ws_realtime(websocket: WebSocket, session_id: str):
     """
     Clients connect to this WS to receive schedule updates for the session_id they started.
     After connecting they will receive an initial schedule_update message immediately.
+    Every message carries the session version it brings the client to.
     """
     await websocket.accept()
-    # ensure session exists
-    if session_id not in _realtime_sessions:
-        await websocket.send_json({"type": "error", "message": "session_not_found"})
-        await websocket.close()
-        return
-
-    # register socket
-    conns = _ws_connections.get(session_id, [])
-    conns.append(websocket)
-    _ws_connections[session_id] = conns
+    # register before reading the session, holding back patches until the
+    # initial message is out, so none committed after the read is missed
+    buffer = _ws_buffers[websocket] = []
+    _ws_connections.setdefault(session_id, set()).add(websocket)
 
     try:
-        # send initial schedule
-        await websocket.send_json({"type": "initial", "schedule": _realtime_sessions[session_id]["current_schedule"]})
+        sess = await _load_session(session_id)
+        if sess is None:
+            await websocket.send_text(orjson.dumps({"type": "error", "message": "session_not_found"}).decode())
+            await websocket.close()
+            return
+
+        # send initial schedule, then whatever arrived meanwhile that it doesn't include
+        _ws_versions[websocket] = sess["version"]
+        await websocket.send_text(orjson.dumps(
+            {"type": "initial", "schedule": sess["current_schedule"], "version": sess["version"]}
+        ).decode())
+        while buffer:
+            version, data = buffer.pop(0)
+            if version > _ws_versions[websocket]:
+                _ws_versions[websocket] = version
+                await websocket.send_text(data)
+        del _ws_buffers[websocket]
+
         # keep connection open and accept pings from client
         while True:
             try:
@@ -400,26 +1098,135 @@ async def ws_realtime(websocket: WebSocket, session_id: str):
     except Exception:
         pass
     finally:
-        # cleanup
-        conns = _ws_connections.get(session_id, [])
+        # cleanup, dropping the session's entry once its last socket is gone
+        _ws_buffers.pop(websocket, None)
+        _ws_versions.pop(websocket, None)
+        conns = _ws_connections.get(session_id)
+        if conns is not None:
+            conns.discard(websocket)
+            if not conns:
+                _ws_connections.pop(session_id, None)
+
+# ---------------------------
+# Periodic cleanup of websocket entries for expired sessions
+# ---------------------------
+_WS_GC_INTERVAL = 300  # seconds
+_ws_gc_task = None
+
+async def _gc_ws_connections():
+    while True:
+        await asyncio.sleep(_WS_GC_INTERVAL)
         try:
-            conns.remove(websocket)
-            _ws_connections[session_id] = conns
-        except ValueError:
-            pass
+            for sid in list(_ws_connections):
+                if not _ws_connections.get(sid) or not await _session_exists(sid):
+                    _ws_connections.pop(sid, None)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("websocket cleanup failed, retrying next interval")
+
+# ---------------------------
+# Relay Redis session updates to this worker's websockets
+# ---------------------------
+_redis_relay_task = None
+
+async def _relay_redis_updates():
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.psubscribe(_updates_channel("*"))
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    session_id = message["channel"].decode().split(":")[1]
+                    data = message["data"].decode()
+                    await _send_to_local_sockets(session_id, data, orjson.loads(data)["version"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("redis relay failed, resubscribing")
+            await asyncio.sleep(1)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    global _ws_gc_task, _redis_relay_task
+    _ws_gc_task = asyncio.create_task(_gc_ws_connections())
+    if redis_client is not None:
+        _redis_relay_task = asyncio.create_task(_relay_redis_updates())
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in (_ws_gc_task, _redis_relay_task):
+        if task is not None:
+            task.cancel()
+    if redis_client is not None:
+        await redis_client.aclose()
 
 # ---------------------------
 # Small helper: list active realtime sessions (debug)
 # ---------------------------
 @app.get("/realtime/sessions")
-def realtime_list_sessions():
-    return {"sessions": list(_realtime_sessions.keys())}
+async def realtime_list_sessions():
+    if redis_client is None:
+        return {"sessions": list(_realtime_sessions.keys())}
+    keys = [k.decode() async for k in redis_client.scan_iter(match=_session_key("*"))]
+    return {"sessions": [k.split(":", 1)[1] for k in keys]}
 
 # ---------------------------
 # Serve React build (dist) as static files
 # ---------------------------
+class CachedStatic(StaticFiles):
+    """
+    StaticFiles for the Vite build: hashed files under assets/ are cached for a
+    year, and a prebuilt .br/.gz sibling is served when the client accepts it.
+    """
+
+    ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # hashed assets never change, so their variant lookups (hits and
+        # misses) are remembered; bounded since request paths are arbitrary
+        self._variants = LRUCache(maxsize=4096)
+
+    async def _find_variant(self, path: str):
+        """(full_path, stat_result) of a regular file at `path`, else None."""
+        if path in self._variants:
+            return self._variants[path]
+        try:
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+        except (OSError, ValueError):
+            full_path, stat_result = None, None
+        found = (full_path, stat_result) if stat_result and stat.S_ISREG(stat_result.st_mode) else None
+        if path.startswith("assets/"):
+            self._variants[path] = found
+        return found
+
+    async def get_response(self, path: str, scope):
+        response = None
+        if scope["method"] in ("GET", "HEAD"):
+            accept = Headers(scope=scope).get("accept-encoding", "")
+            for encoding, suffix in self.ENCODINGS:
+                if encoding not in accept:
+                    continue
+                found = await self._find_variant(path + suffix)
+                if found is not None:
+                    full_path, stat_result = found
+                    # typed as the original file, not the archive
+                    response = FileResponse(full_path, stat_result=stat_result, media_type=mimetypes.guess_type(path)[0])
+                    response.headers["content-encoding"] = encoding
+                    response.headers["vary"] = "Accept-Encoding"
+                    break
+        if response is None:
+            response = await super().get_response(path, scope)
+        elif self.is_not_modified(response.headers, Headers(scope=scope)):
+            response = NotModifiedResponse(response.headers)
+        if path.startswith("assets/") and response.status_code in (200, 304):
+            response.headers["cache-control"] = "public, max-age=31536000, immutable"
+        return response
+
 if os.path.exists("dist"):
-    app.mount("/", StaticFiles(directory="dist", html=True), name="static")
+    app.mount("/", CachedStatic(directory="dist", html=True), name="static")
 else:
     print("⚠️ Warning: 'dist' folder not found. React frontend will not be served.")
 
@@ -429,4 +1236,15 @@ else:
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # uvloop + httptools ship with uvicorn[standard]. Realtime sessions live in
+    # process memory unless REDIS_URL is set, so only scale out when they're shared.
+    default_workers = (os.cpu_count() or 1) * 2 + 1 if redis_url else 1
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", default_workers)),
+        log_level=os.getenv("UVICORN_LOG_LEVEL", "warning"),
+    )
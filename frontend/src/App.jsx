@@ -99,7 +99,12 @@ function App() {
     socket.onopen = () => console.log("WebSocket connected ✅");
     socket.onmessage = (event) => {
       const data = JSON.parse(event.data);
-      setSchedule(data.schedule);
+      if (data.type === "schedule_patch") {
+        // only the tail from `from_index` changed
+        setSchedule((prev) => [...prev.slice(0, data.from_index), ...data.items]);
+      } else {
+        setSchedule(data.schedule);
+      }
     };
     socket.onclose = () => console.log("WebSocket disconnected ❌");
 